@@ -1,38 +1,73 @@
-import cartopy.crs as ccrs
 import earthaccess
-import matplotlib.pyplot as plt
 import numpy as np
 import xarray as xr
-import json
-from matplotlib import rcParams
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+import pickle
 import sqlite3
+import time
 
-rcParams["figure.dpi"] = 80  # Reduce figure resolution to keep file size low
 
 
+print("earthaccess version:", earthaccess.__version__)
 
-# Authenticate
-auth = earthaccess.login()
+# Local cache for granule searches and regional subsets of the granules
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
 
-if not auth.authenticated:
-    auth.login(strategy="interactive", persist=True)
+# Read and write the cache with h5netcdf, falling back to netCDF4 if it isn't installed
+try:
+    import h5netcdf  # noqa: F401
+    CACHE_ENGINE = "h5netcdf"
+except ImportError:
+    CACHE_ENGINE = "netcdf4"
 
-print("earthaccess version:", earthaccess.__version__)
+# Authenticate the first time granule data actually has to be read
+auth = None
 
-# Search for TEMPO NO₂ Level-3 product
-def No2Fetch():
-    results = earthaccess.search_data(
-        short_name="TEMPO_NO2_L3",
-        version="V03",
-        temporal=("2025-09-1 12:00", "2025-09-14 12:00"),
-        count=14,
-    )
+def Login():
+    global auth
+    if auth is None:
+        auth = earthaccess.login()
 
-    print(f"Number of granules found: {len(results)}")
+        if not auth.authenticated:
+            auth.login(strategy="interactive", persist=True)
+
+# How long a cached granule search is reused before searching again, so
+# granules published after the first search are still picked up
+SEARCH_CACHE_MAX_AGE = 24 * 60 * 60  # seconds
+
+# Search for granules, caching the results keyed by the query. Repeat runs
+# within SEARCH_CACHE_MAX_AGE of the last search skip it.
+def SearchGranules(**query):
+    key = hashlib.md5(repr(sorted(query.items())).encode()).hexdigest()
+    cache_path = os.path.join(CACHE_DIR, f"{key}.pkl")
+
+    if os.path.exists(cache_path) and time.time() - os.path.getmtime(cache_path) < SEARCH_CACHE_MAX_AGE:
+        with open(cache_path, "rb") as f:
+            return pickle.load(f)
+
+    results = earthaccess.search_data(**query)
+
+    # Don't cache an empty search, the granules may just not be published yet
+    if results:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(cache_path, "wb") as f:
+            pickle.dump(results, f)
+
+    return results
+
+# Open the given product variables from the granules, along with the
+# coordinates from the root group. Only the product and root groups are
+# read; nothing we use lives in the geolocation group.
+def OpenTempoDataset(results, names):
+    Login()
+
+    # Read straight from S3 when running in-region, otherwise go through HTTPS
+    region = os.environ.get("AWS_REGION", os.environ.get("AWS_DEFAULT_REGION"))
 
-    # Open virtual multi-file dataset
     open_options = {
-        "access": "indirect",  # access to cloud data (faster in AWS with "direct")
+        "access": "direct" if region == "us-west-2" else "indirect",
         "load": True,
         "concat_dim": "time",
         "data_vars": "minimal",
@@ -41,12 +76,99 @@ def No2Fetch():
         "combine_attrs": "override",
     }
 
-    result_root = earthaccess.open_virtual_mfdataset(granules=results, **open_options)
-    result_product = earthaccess.open_virtual_mfdataset(granules=results, group="product", **open_options)
-    result_geolocation = earthaccess.open_virtual_mfdataset(granules=results, group="geolocation", **open_options)
+    # Open both groups concurrently so their metadata reads overlap
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        result_root, result_product = executor.map(
+            lambda group: earthaccess.open_virtual_mfdataset(granules=results, group=group, **open_options),
+            [None, "product"],
+        )
+
+    # Keep only the coordinates from the root group and the variables we need
+    # from the product group before merging
+    result_root = result_root.drop_vars(list(result_root.data_vars))
+    result_product = result_product[names]
 
     # Merge the datasets
-    result_merged = xr.merge([result_root, result_product, result_geolocation])
+    return xr.merge([result_root, result_product])
+
+# Cut the variables we need for the region of interest out of the granules.
+# A local copy chunked for the time-mean access pattern (all of time, 256x256
+# lat/lon tiles) is cached, so later runs over the same granules skip the
+# remote reads entirely.
+def RegionSubset(results, names, lat_bounds, lon_bounds):
+    granule_ids = sorted(granule["meta"]["concept-id"] for granule in results)
+    key = hashlib.md5(repr((granule_ids, names, lat_bounds, lon_bounds)).encode()).hexdigest()
+    cache_path = os.path.join(CACHE_DIR, f"{key}.nc")
+
+    if not os.path.exists(cache_path):
+        merged = OpenTempoDataset(results, names)
+        subset = merged.sel(
+            longitude=slice(lon_bounds[0], lon_bounds[1]),
+            latitude=slice(lat_bounds[0], lat_bounds[1]),
+        )
+
+        encoding = {
+            name: {
+                "chunksizes": tuple(
+                    subset.sizes[dim] if dim == "time" else min(256, subset.sizes[dim])
+                    for dim in subset[name].dims
+                ),
+                "zlib": True,
+                "complevel": 1,
+            }
+            for name in names
+        }
+
+        # Write to a temporary file first so an interrupted run never leaves a partial cache
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        subset.chunk({"time": -1, "latitude": 256, "longitude": 256}).to_netcdf(
+            cache_path + ".tmp", engine=CACHE_ENGINE, encoding=encoding
+        )
+        os.replace(cache_path + ".tmp", cache_path)
+
+    return xr.open_dataset(cache_path, engine=CACHE_ENGINE, chunks={})
+
+# Average a variable over time as a sum/count reduction over the cache's
+# 256x256 tiles, optionally keeping only pixels with a good quality flag. The
+# result is lazy; call .compute() on it.
+def TemporalMean(subset, variable, use_quality_flag=True):
+    # float32 carries plenty of precision for these fields and halves the bytes moved
+    values = subset[variable].astype(np.float32)
+    if use_quality_flag:
+        values = values.where(subset["main_data_quality_flag"] == 0)
+
+    total = values.sum(dim="time", skipna=True)
+    count = values.count(dim="time").astype(np.float32)
+    return total / count.where(count > 0)
+
+# Pull out [lat, lon, value] triplets for the cells of a computed 2-D field
+# where keep is true, indexing the kept cells directly rather than flattening
+# a full meshgrid. NaN cells never pass a comparison, so they drop out too.
+def ExtractPoints(field, keep):
+    lat_idx, lon_idx = np.nonzero(np.asarray(keep))
+    return np.column_stack(
+        (field["latitude"].values[lat_idx], field["longitude"].values[lon_idx], field.values[lat_idx, lon_idx])
+    ).astype(np.float32, copy=False)
+
+# Map values from [min_value, max_value] onto the 0.5-1 intensity range used by
+# the heatmap. Works in place on the array (or column view) it is given, so no
+# temporaries the size of the data are allocated.
+def Rescale(values, min_value, max_value):
+    values -= min_value
+    values /= max_value - min_value
+    values *= 0.5
+    values += 0.5
+
+# Search for TEMPO NO₂ Level-3 product
+def No2Fetch():
+    results = SearchGranules(
+        short_name="TEMPO_NO2_L3",
+        version="V03",
+        temporal=("2025-09-1 12:00", "2025-09-14 12:00"),
+        count=14,
+    )
+
+    print(f"Number of granules found: {len(results)}")
 
     # Define region of interest
     lon_bounds = (-137, -50)
@@ -57,66 +179,31 @@ def No2Fetch():
         f"{abs(lon_bounds[0])}°W to {abs(lon_bounds[1])}°W"
     )
 
-    # Subset to region and compute temporal mean
-    temporal_mean_ds = (
-        result_merged.sel(
-            longitude=slice(lon_bounds[0], lon_bounds[1]),
-            latitude=slice(lat_bounds[0], lat_bounds[1]),
-        )
-        .where(result_merged["main_data_quality_flag"] == 0)
-        .mean(dim="time")
-    )
-
-    print(f"Dataset shape after subsetting: {temporal_mean_ds.dims}")
-
-    # Compute the mean vertical column
-    mean_vertical_column_trop = temporal_mean_ds["vertical_column_troposphere"].compute()
-
-    # --- Convert to list of [lat, lon, mean_trop] ---
-    lats = mean_vertical_column_trop["latitude"].values
-    lons = mean_vertical_column_trop["longitude"].values
-    data = mean_vertical_column_trop.values
-
-    # Ensure arrays align and flatten
-    lat_grid, lon_grid = np.meshgrid(lats, lons, indexing="ij")
-    triplets = np.column_stack((lat_grid.flatten(), lon_grid.flatten(), data.flatten()))
+    # Subset to region (cached locally after the first run) and compute temporal mean
+    subset = RegionSubset(results, ["vertical_column_troposphere", "main_data_quality_flag"], lat_bounds, lon_bounds)
+    mean_vertical_column_trop = TemporalMean(subset, "vertical_column_troposphere")
 
-    # Filter out NaN values
-    triplets = triplets[~np.isnan(triplets[:, 2])]
+    print(f"Dataset shape after subsetting: {mean_vertical_column_trop.shape}")
 
-    # Convert to list of lists
-    triplet_list = triplets.tolist()
+    # Compute the mean vertical column once; everything below works on the 2-D grid
+    mean_vertical_column_trop = mean_vertical_column_trop.compute()
 
-    print(f"Extracted {len(triplet_list)} data points")
+    n_valid = int(np.count_nonzero(~np.isnan(mean_vertical_column_trop.values)))
+    print(f"Extracted {n_valid} data points")
 
     # Define your magnitude threshold
     magnitude = 0.2 * (10 ** 16)  # 2e15
 
-    # Filter triplets: keep only points with value <= magnitude
-    # filtered_triplets = [t for t in triplet_list if t[2] >= magnitude]
-    filtered_triplets = []
-
-    max_value = 0
-
-    for t in triplet_list:
-        if t[2] >= magnitude:
-            filtered_triplets.append(t)
-        
-        # # Set negative data to be 0
-        # if t[2] < 0:
-        #     t[2] = 0
-
-        if t[2] > max_value:
-            max_value = t[2]
-
-    for list in filtered_triplets:
-        list[2] = 0.5 + (list[2] / max_value * 0.5)
+    # Keep only points with value >= magnitude, scaled against the max of all points
+    max_value = float(mean_vertical_column_trop.max())
+    filtered_triplets = ExtractPoints(mean_vertical_column_trop, mean_vertical_column_trop >= magnitude)
+    Rescale(filtered_triplets[:, 2], 0, max_value)
 
-    print(f"Kept {len(filtered_triplets)} of {len(triplet_list)} data points")
+    print(f"Kept {len(filtered_triplets)} of {n_valid} data points")
     return filtered_triplets
 
 def FromaldehydeFetch():
-    results = earthaccess.search_data(
+    results = SearchGranules(
         short_name="TEMPO_HCHO_L3",
         version="V03",
         temporal=("2025-09-1 12:00", "2025-09-14 12:00"),
@@ -125,24 +212,6 @@ def FromaldehydeFetch():
 
     print(f"Number of granules found: {len(results)}")
 
-    # Open virtual multi-file dataset
-    open_options = {
-        "access": "indirect",  # access to cloud data (faster in AWS with "direct")
-        "load": True,
-        "concat_dim": "time",
-        "data_vars": "minimal",
-        "coords": "minimal",
-        "compat": "override",
-        "combine_attrs": "override",
-    }
-
-    result_root = earthaccess.open_virtual_mfdataset(granules=results, **open_options)
-    result_product = earthaccess.open_virtual_mfdataset(granules=results, group="product", **open_options)
-    result_geolocation = earthaccess.open_virtual_mfdataset(granules=results, group="geolocation", **open_options)
-
-    # Merge the datasets
-    result_merged = xr.merge([result_root, result_product, result_geolocation])
-
     # Define region of interest
     lon_bounds = (-137, -50)
     lat_bounds = (17, 56)
@@ -152,66 +221,29 @@ def FromaldehydeFetch():
         f"{abs(lon_bounds[0])}°W to {abs(lon_bounds[1])}°W"
     )
 
-    # Subset to region and compute temporal mean
-    temporal_mean_ds = (
-        result_merged.sel(
-            longitude=slice(lon_bounds[0], lon_bounds[1]),
-            latitude=slice(lat_bounds[0], lat_bounds[1]),
-        )
-        .where(result_merged["main_data_quality_flag"] == 0)
-        .mean(dim="time")
-    )
-
-    print(f"Dataset shape after subsetting: {temporal_mean_ds.dims}")
-
-    # Compute the mean vertical column
-    mean_vertical_column_trop = temporal_mean_ds["vertical_column"].compute()
-
-    # --- Convert to list of [lat, lon, mean_trop] ---
-    lats = mean_vertical_column_trop["latitude"].values
-    lons = mean_vertical_column_trop["longitude"].values
-    data = mean_vertical_column_trop.values
-
-    # Ensure arrays align and flatten
-    lat_grid, lon_grid = np.meshgrid(lats, lons, indexing="ij")
-    triplets = np.column_stack((lat_grid.flatten(), lon_grid.flatten(), data.flatten()))
-
-    # Filter out NaN values
-    triplets = triplets[~np.isnan(triplets[:, 2])]
-
-    # Convert to list of lists
-    triplet_list = triplets.tolist()
-
-    print(f"Extracted {len(triplet_list)} data points")
+    # Subset to region (cached locally after the first run) and compute temporal mean
+    subset = RegionSubset(results, ["vertical_column", "main_data_quality_flag"], lat_bounds, lon_bounds)
+    mean_vertical_column_trop = TemporalMean(subset, "vertical_column")
 
-    # Define your magnitude threshold
-    magnitude = 0.2 * (10 ** 16)  # 2e15
+    print(f"Dataset shape after subsetting: {mean_vertical_column_trop.shape}")
 
-    # Filter triplets: keep only points with value <= magnitude
-    # filtered_triplets = [t for t in triplet_list if t[2] >= magnitude]
-    filtered_triplets = []
+    # Compute the mean vertical column once; everything below works on the 2-D grid
+    mean_vertical_column_trop = mean_vertical_column_trop.compute()
 
-    max_value = 0
-    total = 0
+    n_valid = int(np.count_nonzero(~np.isnan(mean_vertical_column_trop.values)))
+    print(f"Extracted {n_valid} data points")
 
-    for t in triplet_list:
-        if t[2] > max_value:
-            max_value = t[2]
-    
+    # Keep only points above 10% of the max value
+    max_value = float(mean_vertical_column_trop.max())
     threashold = max_value * 0.1
-    for t in triplet_list:
-        if t[2] > threashold:
-            filtered_triplets.append(t)
+    filtered_triplets = ExtractPoints(mean_vertical_column_trop, mean_vertical_column_trop > threashold)
+    Rescale(filtered_triplets[:, 2], 0, max_value)
 
-    for list in filtered_triplets:
-        list[2] = 0.5 + (list[2] / max_value * 0.5)
-        
-
-    print(f"Kept {len(filtered_triplets)} of {len(triplet_list)} data points")
+    print(f"Kept {len(filtered_triplets)} of {n_valid} data points")
     return filtered_triplets
 
 def OzoneFetch():
-    results = earthaccess.search_data(
+    results = SearchGranules(
         short_name="TEMPO_O3TOT_L3",
         version="V03",
         temporal=("2025-09-1 12:00", "2025-09-14 12:00"),
@@ -220,24 +252,6 @@ def OzoneFetch():
 
     print(f"Number of granules found: {len(results)}")
 
-    # Open virtual multi-file dataset
-    open_options = {
-        "access": "indirect",  # access to cloud data (faster in AWS with "direct")
-        "load": True,
-        "concat_dim": "time",
-        "data_vars": "minimal",
-        "coords": "minimal",
-        "compat": "override",
-        "combine_attrs": "override",
-    }
-
-    result_root = earthaccess.open_virtual_mfdataset(granules=results, **open_options)
-    result_product = earthaccess.open_virtual_mfdataset(granules=results, group="product", **open_options)
-    result_geolocation = earthaccess.open_virtual_mfdataset(granules=results, group="geolocation", **open_options)
-
-    # Merge the datasets
-    result_merged = xr.merge([result_root, result_product, result_geolocation])
-
     # Define region of interest
     lon_bounds = (-137, -50)
     lat_bounds = (17, 56)
@@ -247,57 +261,24 @@ def OzoneFetch():
         f"{abs(lon_bounds[0])}°W to {abs(lon_bounds[1])}°W"
     )
 
-    # Subset to region and compute temporal mean
-    temporal_mean_ds = (
-        result_merged.sel(
-            longitude=slice(lon_bounds[0], lon_bounds[1]),
-            latitude=slice(lat_bounds[0], lat_bounds[1]),
-        )
-        # .where(result_merged["main_data_quality_flag"] == 0)
-        .mean(dim="time")
-    )
-
-    print(f"Dataset shape after subsetting: {temporal_mean_ds.dims}")
+    # Subset to region (cached locally after the first run) and compute temporal mean
+    subset = RegionSubset(results, ["o3_below_cloud"], lat_bounds, lon_bounds)
+    mean_vertical_column_trop = TemporalMean(subset, "o3_below_cloud", use_quality_flag=False)
 
-    # Compute the mean vertical column
-    mean_vertical_column_trop = temporal_mean_ds["o3_below_cloud"].compute()
+    print(f"Dataset shape after subsetting: {mean_vertical_column_trop.shape}")
 
-    # --- Convert to list of [lat, lon, mean_trop] ---
-    lats = mean_vertical_column_trop["latitude"].values
-    lons = mean_vertical_column_trop["longitude"].values
-    data = mean_vertical_column_trop.values
+    # Compute the mean vertical column once; everything below works on the 2-D grid
+    mean_vertical_column_trop = mean_vertical_column_trop.compute()
 
-    # Ensure arrays align and flatten
-    lat_grid, lon_grid = np.meshgrid(lats, lons, indexing="ij")
-    triplets = np.column_stack((lat_grid.flatten(), lon_grid.flatten(), data.flatten()))
+    n_valid = int(np.count_nonzero(~np.isnan(mean_vertical_column_trop.values)))
+    print(f"Extracted {n_valid} data points")
 
-    # Filter out NaN values
-    triplets = triplets[~np.isnan(triplets[:, 2])]
+    # Keep only points between 10 and 100, scaled against the max of the kept points
+    filtered_triplets = ExtractPoints(mean_vertical_column_trop, (mean_vertical_column_trop > 10) & (mean_vertical_column_trop < 100))
+    max_value = filtered_triplets[:, 2].max(initial=0)
+    Rescale(filtered_triplets[:, 2], 0, max_value)
 
-    # Convert to list of lists
-    triplet_list = triplets.tolist()
-
-    print(f"Extracted {len(triplet_list)} data points")
-
-    # Define your magnitude threshold
-    magnitude = 0.2 * (10 ** 16)  # 2e15
-
-    # Filter triplets: keep only points with value <= magnitude
-    # filtered_triplets = [t for t in triplet_list if t[2] >= magnitude]
-    filtered_triplets = []
-
-    max_value = 0
-    for t in triplet_list:
-        if t[2] > 10 and t[2] < 100:
-            filtered_triplets.append(t)
-            if t[2] > max_value:
-                max_value = t[2]        
-        
-    for list in filtered_triplets:
-        list[2] = 0.5 + (list[2] / max_value * 0.5)
-        
-
-    print(f"Kept {len(filtered_triplets)} of {len(triplet_list)} data points")
+    print(f"Kept {len(filtered_triplets)} of {n_valid} data points")
     return filtered_triplets
 
 
@@ -305,7 +286,7 @@ def OzoneFetch():
 
 
 def AerosolFetch():
-    results = earthaccess.search_data(
+    results = SearchGranules(
         short_name="TEMPO_O3TOT_L3",
         version="V03",
         temporal=("2025-09-1 12:00", "2025-09-14 12:00"),
@@ -314,24 +295,6 @@ def AerosolFetch():
 
     print(f"Number of granules found: {len(results)}")
 
-    # Open virtual multi-file dataset
-    open_options = {
-        "access": "indirect",  # access to cloud data (faster in AWS with "direct")
-        "load": True,
-        "concat_dim": "time",
-        "data_vars": "minimal",
-        "coords": "minimal",
-        "compat": "override",
-        "combine_attrs": "override",
-    }
-
-    result_root = earthaccess.open_virtual_mfdataset(granules=results, **open_options)
-    result_product = earthaccess.open_virtual_mfdataset(granules=results, group="product", **open_options)
-    result_geolocation = earthaccess.open_virtual_mfdataset(granules=results, group="geolocation", **open_options)
-
-    # Merge the datasets
-    result_merged = xr.merge([result_root, result_product, result_geolocation])
-
     # Define region of interest
     lon_bounds = (-137, -50)
     lat_bounds = (17, 56)
@@ -341,60 +304,25 @@ def AerosolFetch():
         f"{abs(lon_bounds[0])}°W to {abs(lon_bounds[1])}°W"
     )
 
-    # Subset to region and compute temporal mean
-    temporal_mean_ds = (
-        result_merged.sel(
-            longitude=slice(lon_bounds[0], lon_bounds[1]),
-            latitude=slice(lat_bounds[0], lat_bounds[1]),
-        )
-        # .where(result_merged["main_data_quality_flag"] == 0)
-        .mean(dim="time")
-    )
-
-    print(f"Dataset shape after subsetting: {temporal_mean_ds.dims}")
+    # Subset to region (cached locally after the first run) and compute temporal mean
+    subset = RegionSubset(results, ["uv_aerosol_index"], lat_bounds, lon_bounds)
+    mean_vertical_column_trop = TemporalMean(subset, "uv_aerosol_index", use_quality_flag=False)
 
-    # Compute the mean vertical column
-    mean_vertical_column_trop = temporal_mean_ds["uv_aerosol_index"].compute()
+    print(f"Dataset shape after subsetting: {mean_vertical_column_trop.shape}")
 
-    # --- Convert to list of [lat, lon, mean_trop] ---
-    lats = mean_vertical_column_trop["latitude"].values
-    lons = mean_vertical_column_trop["longitude"].values
-    data = mean_vertical_column_trop.values
+    # Compute the mean vertical column once; everything below works on the 2-D grid
+    mean_vertical_column_trop = mean_vertical_column_trop.compute()
 
-    # Ensure arrays align and flatten
-    lat_grid, lon_grid = np.meshgrid(lats, lons, indexing="ij")
-    triplets = np.column_stack((lat_grid.flatten(), lon_grid.flatten(), data.flatten()))
+    n_valid = int(np.count_nonzero(~np.isnan(mean_vertical_column_trop.values)))
+    print(f"Extracted {n_valid} data points")
 
-    # Filter out NaN values
-    triplets = triplets[~np.isnan(triplets[:, 2])]
+    # Keep only points between -1 and 30, scaled between the min and max of the kept points
+    filtered_triplets = ExtractPoints(mean_vertical_column_trop, (mean_vertical_column_trop > -1) & (mean_vertical_column_trop < 30))
+    max_value = filtered_triplets[:, 2].max(initial=0)
+    min_value = filtered_triplets[:, 2].min(initial=0)
+    Rescale(filtered_triplets[:, 2], min_value, max_value)
 
-    # Convert to list of lists
-    triplet_list = triplets.tolist()
-
-    print(f"Extracted {len(triplet_list)} data points")
-
-    # Define your magnitude threshold
-    magnitude = 0.2 * (10 ** 16)  # 2e15
-
-    # Filter triplets: keep only points with value <= magnitude
-    # filtered_triplets = [t for t in triplet_list if t[2] >= magnitude]
-    filtered_triplets = []
-
-    max_value = 0
-    min_value = 0
-    for t in triplet_list:
-        if t[2] > -1 and t[2] < 30:
-            filtered_triplets.append(t)
-            if t[2] > max_value:
-                max_value = t[2]
-            elif t[2] < min_value:
-                min_value = t[2]        
-        
-    for list in filtered_triplets:
-        list[2] = 0.5 + ((list[2] - min_value) / (max_value - min_value)) * 0.5
-        
-
-    print(f"Kept {len(filtered_triplets)} of {len(triplet_list)} data points")
+    print(f"Kept {len(filtered_triplets)} of {n_valid} data points")
     return filtered_triplets
 
 filtered_triplets = AerosolFetch()
@@ -402,28 +330,49 @@ filtered_triplets = AerosolFetch()
 conn = sqlite3.connect("data.db")
 cursor = conn.cursor()
 
-# Create a table for NO₂ data (if it doesn't exist)
+# Tune SQLite for a one-off bulk load. WAL with synchronous=OFF still survives
+# the script crashing mid-load, so the other tables in data.db are safe.
+cursor.executescript("""
+PRAGMA journal_mode = WAL;
+PRAGMA synchronous = OFF;
+PRAGMA temp_store = MEMORY;
+PRAGMA cache_size = -200000;
+""")
+
+# Rebuild and reload the table in a single transaction
+cursor.execute("BEGIN")
+
+# Recreate the table rather than clearing it, so older copies of data.db
+# (which used AUTOINCREMENT) pick up the plain rowid primary key
+cursor.execute("DROP TABLE IF EXISTS Aerosol_data")
 cursor.execute("""
-CREATE TABLE IF NOT EXISTS Aerosol_data (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
+CREATE TABLE Aerosol_data (
+    id INTEGER PRIMARY KEY,
     latitude REAL,
     longitude REAL,
     value REAL
 )
 """)
 
-# Clear existing data (optional - remove if you want to append)
-cursor.execute("DELETE FROM Aerosol_data")
+# Insert the triplets in 10k-row batches, converting each slice to plain
+# Python floats in one go
+batch_size = 10000
+for start in range(0, len(filtered_triplets), batch_size):
+    cursor.executemany(
+        "INSERT INTO Aerosol_data (latitude, longitude, value) VALUES (?, ?, ?)",
+        filtered_triplets[start:start + batch_size].tolist()
+    )
 
-# Insert the triplets
-cursor.executemany(
-    "INSERT INTO Aerosol_data (latitude, longitude, value) VALUES (?, ?, ?)",
-    filtered_triplets
-)
+# Any secondary indexes (e.g. on latitude, longitude) belong here, after the
+# bulk insert, so they are built in one pass instead of row by row
 
 # Commit the transaction
 conn.commit()
 
+# Switch back to a rollback journal, which checkpoints the WAL into data.db
+# and leaves the file header in the mode sql.js in the frontend can read
+cursor.execute("PRAGMA journal_mode = DELETE")
+
 # Verify the data was saved
 # cursor.execute("SELECT COUNT(*) FROM no2_data")
 # count = cursor.fetchone()[0]